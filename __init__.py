@@ -1,8 +1,5 @@
-from __future__ import print_function
+import struct
 
-import struct, ctypes
-
-from collections import defaultdict
 from binaryninja import (
     Architecture, RegisterInfo, InstructionInfo,
     InstructionTextToken, InstructionTextTokenType,
@@ -14,9 +11,35 @@ from binaryninja import (
     log_error,
     CallingConvention)
 
-def sign_extend(value, bits):
-    sign_bit = 1 << (bits - 1)
-    return (value & (sign_bit - 1)) - (value & sign_bit)
+_U4H_FROM = struct.Struct('<4H').unpack_from
+
+# Readers for data shorter than a full 8-byte instruction, indexed by the number
+# of whole halfwords available. Missing halfwords are padded with None.
+_ShortReads = (
+    None,
+    lambda data: struct.unpack_from('<H', data) + (None, None, None),
+    lambda data: struct.unpack_from('<2H', data) + (None, None),
+    lambda data: struct.unpack_from('<3H', data) + (None,),
+)
+
+# Sign bits for the fixed-width fields the decoder extracts. A field that is
+# exactly n bits wide is sign extended inline with (x ^ _SBn) - _SBn, which
+# avoids a function call per field.
+_SB5 = 1 << 4
+_SB9 = 1 << 8
+_SB16 = 1 << 15
+_SB22 = 1 << 21
+_SB23 = 1 << 22
+_SB32 = 1 << 31
+
+# Every 9-bit value (branch displacements, mul immediates), already sign
+# extended.
+SignExtended9 = tuple((disp ^ _SB9) - _SB9 for disp in range(1 << 9))
+
+# Decoder result for anything that is not a valid instruction. Decode results
+# are (instr, length, src_reg, dst_reg, reg3, reg4, immed, cond) tuples, and
+# every failure path returns this one shared tuple.
+ERROR_TUPLE = (None, None, None, None, None, None, None, None)
 
 REGISTER_REGISTER_MODE = 0         # r1, r2
 SINGLE_REGISTER_MODE = 1           # r1
@@ -29,7 +52,7 @@ IMMEDIATE_MODE = 7                 # callt 25
 OFFSET_MODE = 8                    # jr 123
 OFFSET_REGISTER_MODE = 9           # 
 
-Registers = [
+Registers = (
     'r0',
     'r1',
     'r2',
@@ -63,7 +86,11 @@ Registers = [
     'ep',
     'lp',
     'pc',
-]
+)
+
+RegisterIndex = dict((name, i) for i, name in enumerate(Registers))
+SP_IDX = RegisterIndex['sp']
+EP_IDX = RegisterIndex['ep']
 
 NoRegisterInstructions = {
     0x0: 'nop',
@@ -83,278 +110,506 @@ ThirtyTwoBitNoRegisterInstructions = {
     0x87e00160: 'ei'
 }
 
-OneRegInstructions = [
+OneRegInstructions = frozenset([
     'switch', 'zxb', 'sxb', 'zxh', 'sxh'
-]
+])
 
-TwoRegInstructions = [
+TwoRegInstructions = frozenset([
     'mov', 'not', 'divh', 'satsubr', 'satsub', 'satadd', 'mulh', 'or', 'xor',
     'and', 'tst', 'subr', 'sub', 'add', 'cmp',
-]
+])
 
-RegImmediateInstructions = [
+RegImmediateInstructions = frozenset([
     'mov', 'satadd', 'add', 'cmp', 'shr', 'sar', 'shl', 'mulh'
-]
+])
 
-ImmediateRegRegInstructions = [
+ImmediateRegRegInstructions = frozenset([
     'addi', 'movea', 'movhi', 'satsubi', 'ori', 'xori', 'andi', 'mulhi'
-]
+])
 
-LoadInstructions = [
+LoadInstructions = frozenset([
     'ld.b', 'ld.bu', 'ld.h', 'ld.hu', 'ld.w',
     'sld.b', 'sld.bu', 'sld.h', 'sld.hu', 'sld.w'
-]
+])
 
-StoreInstructions = [
+StoreInstructions = frozenset([
     'st.b', 'st.h', 'st.w',
     'sst.b', 'sst.h', 'sst.w'
-]
+])
+
+MulInstructions = frozenset(['mul', 'mulu'])
 
 # TODO: instructions with conditions: ADF, SBF, SETF, B, CMOV, SASF
 
-TypeOneRegRegInstructions = {
-    0x00: lambda reg1, reg2: ('mov', reg1, reg2),
-    0x01: lambda reg1, reg2: ('not', reg1, reg2),
+# Plain format I reg-reg opcodes, indexed by opcode. None marks the opcodes
+# that alias other instructions depending on their register fields.
+TypeOneRegRegInstructions = (
+    'mov', 'not', None, None, None, None, None, None,
+    'or', 'xor', 'and', 'tst', 'subr', 'sub', 'add', 'cmp',
+)
+
+TypeOneRegRegAliasInstructions = {
     0x02: lambda reg1, reg2: ('switch', None, reg1) if reg2 == 0 else ('fetrap', None, reg2 & 0xf) if reg1 == 0 else ('divh', reg1, reg2),
     0x04: lambda reg1, reg2: ('satsubr', reg1, reg2) if reg2 != 0 else ('zxb', None, reg1),
     0x05: lambda reg1, reg2: ('satsub', reg1, reg2) if reg2 != 0 else ('sxb', None, reg1),
     0x06: lambda reg1, reg2: ('satadd', reg1, reg2) if reg2 != 0 else ('zxh', None, reg1),
     0x07: lambda reg1, reg2: ('mulh', reg1, reg2) if reg2 != 0 else ('sxh', None, reg1),
-    0x08: lambda reg1, reg2: ('or', reg1, reg2),
-    0x09: lambda reg1, reg2: ('xor', reg1, reg2),
-    0x0a: lambda reg1, reg2: ('and', reg1, reg2),
-    0x0b: lambda reg1, reg2: ('tst', reg1, reg2),
-    0x0c: lambda reg1, reg2: ('subr', reg1, reg2),
-    0x0d: lambda reg1, reg2: ('sub', reg1, reg2),
-    0x0e: lambda reg1, reg2: ('add', reg1, reg2),
-    0x0f: lambda reg1, reg2: ('cmp', reg1, reg2),
 }
 
 TypeOneImmediateRegInstructions = {
-    0x03: lambda reg1, reg2: ('jmp', None, reg1) if reg2 == 0 else ('sld.hu', (reg1 & 0xf) << 1, reg2) if reg1 & 0x10 == 0x10 else ('sld.bu', reg1 & 0xf, reg2),
-    0x10: lambda reg1, reg2: ('mov', sign_extend(reg1, 5), reg2),
+    0x10: lambda reg1, reg2: ('mov', (reg1 ^ _SB5) - _SB5, reg2),
     0x11: lambda reg1, reg2: ('satadd', reg1, reg2),
-    0x12: lambda reg1, reg2: ('add', sign_extend(reg1, 5), reg2),
-    0x13: lambda reg1, reg2: ('cmp', sign_extend(reg1, 5), reg2),
+    0x12: lambda reg1, reg2: ('add', (reg1 ^ _SB5) - _SB5, reg2),
+    0x13: lambda reg1, reg2: ('cmp', (reg1 ^ _SB5) - _SB5, reg2),
     0x14: lambda reg1, reg2: ('callt', reg2 << 1, None) if reg1 == 0 else ('shr', reg1, reg2),
     0x15: lambda reg1, reg2: ('callt', (reg2 | 0x20) << 1, None) if reg1 == 0 else ('sar', reg1, reg2),
     0x16: lambda reg1, reg2: ('shl', reg1, reg2),
 }
 
+# Format IV short load/stores indexed by opcode >> 2, each with the mask and
+# shift that turn the low bits of the instruction into its displacement. The
+# base register is always ep, so it is filled in here rather than by every
+# consumer.
+# sld.w and sst.w share opcodes 0x28-0x2b and are told apart by bit 0; only
+# sld.w is listed here, sst.w is installed next to it in ShortWordDecoders.
 TypeFourShortLoadStoreInstructions = {
-    0x6: lambda reg2, disp: ('sld.b', None, reg2, disp),
-    0x7: lambda reg2, disp: ('sst.b', reg2, None, disp),
-    0x8: lambda reg2, disp: ('sld.h', None, reg2, disp << 1),
-    0x9: lambda reg2, disp: ('sst.h', reg2, None, disp << 1),
-    0xa: lambda reg2, disp: ('sld.w', None, reg2, disp << 1) if disp & 0x1 == 0 else ('sst.w', reg2, None, (disp & 0x7e) << 1),
+    0x6: (lambda reg2, disp: ('sld.b', EP_IDX, reg2, disp), 0x7f, 0),
+    0x7: (lambda reg2, disp: ('sst.b', reg2, EP_IDX, disp), 0x7f, 0),
+    0x8: (lambda reg2, disp: ('sld.h', EP_IDX, reg2, disp), 0x7f, 1),
+    0x9: (lambda reg2, disp: ('sst.h', reg2, EP_IDX, disp), 0x7f, 1),
+    0xa: (lambda reg2, disp: ('sld.w', EP_IDX, reg2, disp), 0x7e, 1),
 }
 
-BitManipulationInstructions = [
-    lambda reg1, bitnum, disp: ('set1', 4, reg1, bitnum, sign_extend(disp, 16)),
-    lambda reg1, bitnum, disp: ('not1', 4, reg1, bitnum, sign_extend(disp, 16)),
-    lambda reg1, bitnum, disp: ('clr1', 4, reg1, bitnum, sign_extend(disp, 16)),
-    lambda reg1, bitnum, disp: ('tst1', 4, reg1, bitnum, sign_extend(disp, 16)),
-]
+# Format VIII bit manipulation, indexed by the top two bits of the first
+# halfword.
+def decode_set1_imm(reg1, bitnum, disp):
+    return 'set1', 4, reg1, bitnum, None, None, (disp ^ _SB16) - _SB16, None
+
+def decode_not1_imm(reg1, bitnum, disp):
+    return 'not1', 4, reg1, bitnum, None, None, (disp ^ _SB16) - _SB16, None
+
+def decode_clr1_imm(reg1, bitnum, disp):
+    return 'clr1', 4, reg1, bitnum, None, None, (disp ^ _SB16) - _SB16, None
+
+def decode_tst1_imm(reg1, bitnum, disp):
+    return 'tst1', 4, reg1, bitnum, None, None, (disp ^ _SB16) - _SB16, None
+
+BitManipulationInstructions = (decode_set1_imm, decode_not1_imm, decode_clr1_imm, decode_tst1_imm)
 
-class Register_List_Bits (ctypes.LittleEndianStructure):
-    _fields_ = [
-        ('r31', ctypes.c_uint16, 1),
-        ('r29', ctypes.c_uint16, 1),
-        ('r28', ctypes.c_uint16, 1),
-        ('r23', ctypes.c_uint16, 1),
-        ('r22', ctypes.c_uint16, 1),
-        ('r21', ctypes.c_uint16, 1),
-        ('r20', ctypes.c_uint16, 1),
-        ('r27', ctypes.c_uint16, 1),
-        ('r26', ctypes.c_uint16, 1),
-        ('r25', ctypes.c_uint16, 1),
-        ('r24', ctypes.c_uint16, 1),
-        ('r30', ctypes.c_uint16, 1),
-    ]
-class Register_List (ctypes.Union):
-    _anonymous_ = ('bit',)
-    _fields_ = [
-        ('bit', Register_List_Bits),
-        ('asWord', ctypes.c_uint16)
-    ]
+# Bit positions of the prepare/dispose register list, least significant first.
+RegisterListBits = (
+    'r31', 'r29', 'r28', 'r23', 'r22', 'r21',
+    'r20', 'r27', 'r26', 'r25', 'r24', 'r30',
+)
+
+def expand_register_list(word):
+    names = sorted(name for bit, name in enumerate(RegisterListBits) if word & (1 << bit))
+    return tuple({'r30': 'ep', 'r31': 'lp'}.get(name, name) for name in names)
+
+# Printable register names for every possible 12-bit register list, in
+# ascending register order.
+RegisterLists = tuple(expand_register_list(word) for word in range(1 << len(RegisterListBits)))
+# Same lists in descending order, the order dispose pops them in.
+RegisterListsDescending = tuple(registers[::-1] for registers in RegisterLists)
 
 def decode_dispose(i1, i2):
     immed = ((i1 >> 1) & 0x1f) << 2
     reg1 = i2 & 0x1f
-    reg_list = Register_List()
-    reg_list.asWord = ((i1 & 0x1) << 11) | (i2 >> 5)
+    reg_list = ((i1 & 0x1) << 11) | (i2 >> 5)
+
+    return 'dispose', 4, reg1 if reg1 != 0 else None, reg_list, None, None, immed, None
 
-    return 'dispose', 4, reg1 if reg1 != 0 else None, reg_list, immed
+# prepare sub-opcodes: register-only, sp to ep, and 16-bit, high 16-bit and
+# 32-bit immediate to ep forms.
+PrepareSubops = frozenset([0x01, 0x03, 0x0b, 0x13, 0x1b])
 
-def decode_3c_and_3d(data):
-    i1 = struct.unpack('<H', data[0:2])[0]
-    i2 = struct.unpack('<H', data[2:4])[0]
+def decode_3c_and_3d(i1, i2, i3, i4):
     reg1 = i1 & 0x1f
     reg2 = i1 >> 11
 
-    if i2 & 0x1 == 0 and reg2 != 0:
-        return 'jarl', 4, None, reg2, sign_extend(((i1 & 0x3f) << 16) | i2, 22)
-    if i2 & 0x1 == 0 and reg2 == 0:
-        return 'jr', 4, None, None, sign_extend(((i1 & 0x3f) << 16) | i2, 22)
+    if i2 & 0x1 == 0:
+        disp22 = ((((i1 & 0x3f) << 16) | i2) ^ _SB22) - _SB22
+        if reg2 != 0:
+            return 'jarl', 4, None, reg2, None, None, disp22, None
+        return 'jr', 4, None, None, None, None, disp22, None
     if reg2 != 0:
-        reg1 = (i1 & 0x1f)
         low_bit = (i1 >> 5) & 0x1
-        return 'ld.bu', 4, reg1, reg2, sign_extend((i2 & 0xfffe) | low_bit, 16)
+        return 'ld.bu', 4, reg1, reg2, None, None, (((i2 & 0xfffe) | low_bit) ^ _SB16) - _SB16, None
 
     subop = i2 & 0x1f
 
-    if subop == 1:
+    if subop in PrepareSubops:
         immed = ((i1 >> 1) & 0x1f) << 2
-        reg_list = Register_List()
-        reg_list.asWord = ((i1 & 0x1) << 11) | (i2 >> 5)
-        return 'prepare', 4, None, reg_list, immed
-    if subop == 3:
-        immed = ((i1 >> 1) & 0x1f) << 2
-        reg_list = Register_List()
-        reg_list.asWord = ((i1 & 0x1) << 11) | (i2 >> 5)
-        return 'prepare', 4, Registers.index('sp'), reg_list, immed
-
-    i3 = struct.unpack('<H', data[4:6])[0]
-
-    if subop == 0xb or subop == 0x13:
-        immed = ((i1 >> 1) & 0x1f) << 2
-        reg_list = Register_List()
-        reg_list.asWord = ((i1 & 0x1) << 11) | (i2 >> 5)
-        return 'prepare', 6, sign_extend(i3, 16) if subop == 0xb else i3 << 16, reg_list, immed
-    if subop == 0x1b:
-        immed = ((i1 >> 1) & 0x1f) << 2
-        reg_list = Register_List()
-        reg_list.asWord = ((i1 & 0x1) << 11) | (i2 >> 5)
-        i4 = struct.unpack('<H', data[6:8])[0]
-        return 'prepare', 8, i4 << 16 | i3, reg_list, immed
+        reg_list = ((i1 & 0x1) << 11) | (i2 >> 5)
+        if subop == 1:
+            return 'prepare', 4, None, reg_list, None, None, immed, None
+        if subop == 3:
+            return 'prepare', 4, SP_IDX, reg_list, None, None, immed, None
+        if i3 is None:
+            return ERROR_TUPLE
+        if subop == 0xb:
+            return 'prepare', 6, (i3 ^ _SB16) - _SB16, reg_list, None, None, immed, None
+        if subop == 0x13:
+            return 'prepare', 6, i3 << 16, reg_list, None, None, immed, None
+        if i4 is None:
+            return ERROR_TUPLE
+        return 'prepare', 8, i4 << 16 | i3, reg_list, None, None, immed, None
+
+    if i3 is None:
+        return ERROR_TUPLE
 
     composite_opcode = (i1 & 0x20) | (i2 & 0xf)
     reg3 = (i2 >> 11) & 0x1f
     disp23 = ((i2 >> 4) & 0x7f) | (i3 << 7)
-    if composite_opcode in LongLoadStoreInstructions:
-        return LongLoadStoreInstructions[composite_opcode](reg1, reg3, disp23)
-    return None, None, None, None, None
+    handler = LongLoadStoreTable[composite_opcode]
+    if handler is not None:
+        return handler(reg1, reg3, disp23)
+    return ERROR_TUPLE
 
 LongLoadStoreInstructions = {
-    0x05: lambda reg1, reg3, disp23: ('ld.b', 6, reg1, reg3, sign_extend(disp23, 23)),
-    0x07: lambda reg1, reg3, disp23: ('ld.h', 6, reg1, reg3, sign_extend(disp23, 23)),
-    0x09: lambda reg1, reg3, disp23: ('ld.w', 6, reg1, reg3, sign_extend(disp23, 23)),
-    0x0d: lambda reg1, reg3, disp23: ('st.b', 6, reg3, reg1, sign_extend(disp23, 23)),
-    0x0f: lambda reg1, reg3, disp23: ('st.w', 6, reg3, reg1, sign_extend(disp23, 23)),
-    0x25: lambda reg1, reg3, disp23: ('ld.bu', 6, reg1, reg3, sign_extend(disp23, 23)),
-    0x27: lambda reg1, reg3, disp23: ('ld.hu', 6, reg1, reg3, sign_extend(disp23, 23)),
-    0x2d: lambda reg3, reg1, disp23: ('st.h', 6, reg1, reg3, sign_extend(disp23, 23)),
+    0x05: lambda reg1, reg3, disp23: ('ld.b', 6, reg1, reg3, None, None, (disp23 ^ _SB23) - _SB23, None),
+    0x07: lambda reg1, reg3, disp23: ('ld.h', 6, reg1, reg3, None, None, (disp23 ^ _SB23) - _SB23, None),
+    0x09: lambda reg1, reg3, disp23: ('ld.w', 6, reg1, reg3, None, None, (disp23 ^ _SB23) - _SB23, None),
+    0x0d: lambda reg1, reg3, disp23: ('st.b', 6, reg3, reg1, None, None, (disp23 ^ _SB23) - _SB23, None),
+    0x0f: lambda reg1, reg3, disp23: ('st.w', 6, reg3, reg1, None, None, (disp23 ^ _SB23) - _SB23, None),
+    0x25: lambda reg1, reg3, disp23: ('ld.bu', 6, reg1, reg3, None, None, (disp23 ^ _SB23) - _SB23, None),
+    0x27: lambda reg1, reg3, disp23: ('ld.hu', 6, reg1, reg3, None, None, (disp23 ^ _SB23) - _SB23, None),
+    0x2d: lambda reg1, reg3, disp23: ('st.h', 6, reg3, reg1, None, None, (disp23 ^ _SB23) - _SB23, None),
 }
 
+# LongLoadStoreInstructions indexed directly by the 6-bit composite opcode.
+LongLoadStoreTable = [None] * 64
+for composite_opcode, fn in LongLoadStoreInstructions.items():
+    LongLoadStoreTable[composite_opcode] = fn
+
+# Format V-VII instructions whose opcode alone selects the decoder. Called
+# with the register fields and the first three halfwords.
+def decode_addi(reg1, reg2, i1, i2, i3):
+    return 'addi', 4, reg1, reg2, None, None, (i2 ^ _SB16) - _SB16, None
+
+def decode_movea(reg1, reg2, i1, i2, i3):
+    if reg2 != 0:
+        return 'movea', 4, reg1, reg2, None, None, (i2 ^ _SB16) - _SB16, None
+    if i3 is None:
+        return ERROR_TUPLE
+    return 'mov', 6, None, reg1, None, None, (i3 << 16) | i2, None
+
+def decode_movhi(reg1, reg2, i1, i2, i3):
+    if reg2 != 0:
+        return 'movhi', 4, reg1, reg2, None, None, i2, None
+    return decode_dispose(i1, i2)
+
+def decode_satsubi(reg1, reg2, i1, i2, i3):
+    if reg2 != 0:
+        return 'satsubi', 4, reg1, reg2, None, None, i2 << 16, None
+    return decode_dispose(i1, i2)
+
+def decode_ori(reg1, reg2, i1, i2, i3):
+    return 'ori', 4, reg1, reg2, None, None, i2, None
+
+def decode_xori(reg1, reg2, i1, i2, i3):
+    return 'xori', 4, reg1, reg2, None, None, i2, None
+
+def decode_andi(reg1, reg2, i1, i2, i3):
+    return 'andi', 4, reg1, reg2, None, None, i2, None
+
+def decode_mulhi(reg1, reg2, i1, i2, i3):
+    if reg2 != 0:
+        return 'mulhi', 4, reg1, reg2, None, None, (i2 ^ _SB16) - _SB16, None
+    if i3 is None:
+        return ERROR_TUPLE
+    return 'jmp', 6, None, reg1, None, None, (i3 << 16) | i2, None
+
+def decode_ld_b(reg1, reg2, i1, i2, i3):
+    return 'ld.b', 4, reg1, reg2, None, None, (i2 ^ _SB16) - _SB16, None
+
+def decode_ld_h(reg1, reg2, i1, i2, i3):
+    if i2 & 0x1 == 0:
+        return 'ld.h', 4, reg1, reg2, None, None, (i2 ^ _SB16) - _SB16, None
+    return 'ld.w', 4, reg1, reg2, None, None, ((i2 & 0xfffe) ^ _SB16) - _SB16, None
+
+def decode_st_b(reg1, reg2, i1, i2, i3):
+    return 'st.b', 4, reg2, reg1, None, None, (i2 ^ _SB16) - _SB16, None
+
+def decode_st_h(reg1, reg2, i1, i2, i3):
+    if i2 & 0x1 == 0:
+        return 'st.h', 4, reg2, reg1, None, None, (i2 ^ _SB16) - _SB16, None
+    return 'st.w', 4, reg2, reg1, None, None, ((i2 & 0xfffe) ^ _SB16) - _SB16, None
+
 SimpleThirtyTwoBitInstructions = {
-    0x30: lambda reg1, reg2, _, i2, _2: ('addi', 4, reg1, reg2, sign_extend(i2, 16)),
-    0x31: lambda reg1, reg2, _, i2, i3: ('movea', 4, reg1, reg2, sign_extend(i2, 16)) if reg2 != 0 else ('mov', 6, None, reg1, (i3 << 16) | i2),
-    0x32: lambda reg1, reg2, i1, i2, i3: ('movhi', 4, reg1, reg2, i2) if reg2 != 0 else decode_dispose(i1, i2),
-    0x33: lambda reg1, reg2, i1, i2, i3: ('satsubi', 4, reg1, reg2, i2 << 16) if reg2 != 0 else decode_dispose(i1, i2),
-    0x34: lambda reg1, reg2, _, i2, _2: ('ori', 4, reg1, reg2, i2),
-    0x35: lambda reg1, reg2, _, i2, _2: ('xori', 4, reg1, reg2, i2),
-    0x36: lambda reg1, reg2, _, i2, _2: ('andi', 4, reg1, reg2, i2),
-    0x37: lambda reg1, reg2, _, i2, i3: ('mulhi', 4, reg1, reg2, sign_extend(i2, 16)) if reg2 != 0 else ('jmp', 6, None, reg1, (i3 << 16) | i2),
-    0x38: lambda reg1, reg2, _, i2, _2: ('ld.b', 4, reg1, reg2, sign_extend(i2, 16)),
-    0x39: lambda reg1, reg2, _, i2, _2: ('ld.h', 4, reg1, reg2, sign_extend(i2, 16)) if i2 & 0x1 == 0 else ('ld.w', 4, reg1, reg2, sign_extend(i2 & 0xfffe, 16)),
-    0x3a: lambda reg1, reg2, _, i2, _2: ('st.b', 4, reg2, reg1, sign_extend(i2, 16)),
-    0x3b: lambda reg1, reg2, _, i2, _2: ('st.h', 4, reg2, reg1, sign_extend(i2, 16)) if i2 & 0x1 == 0 else ('st.w', 4, reg2, reg1, sign_extend(i2 & 0xfffe, 16)),
+    0x30: decode_addi,
+    0x31: decode_movea,
+    0x32: decode_movhi,
+    0x33: decode_satsubi,
+    0x34: decode_ori,
+    0x35: decode_xori,
+    0x36: decode_andi,
+    0x37: decode_mulhi,
+    0x38: decode_ld_b,
+    0x39: decode_ld_h,
+    0x3a: decode_st_b,
+    0x3b: decode_st_h,
 }
 
+# Instruction length by opcode for instructions that never branch and whose
+# size is fixed by the opcode, so get_instruction_info can skip decoding them.
+# 0 means the instruction has to go through the full decoder. Opcode 0x31 is
+# 4 bytes except for the 6-byte mov imm32 form (reg2 == 0).
+OpcodeLengths = bytearray(64)
+for op in [0x00, 0x01] + list(range(0x04, 0x17)) + list(range(0x18, 0x2c)):
+    OpcodeLengths[op] = 2
+for op in [0x30, 0x31, 0x34, 0x35, 0x36, 0x38, 0x39, 0x3a, 0x3b]:
+    OpcodeLengths[op] = 4
+OpcodeLengths = bytes(OpcodeLengths)
+
+# OpcodeLengths expanded over every possible first halfword, with the mov imm32
+# correction applied, so the length check is a single index. The opcode sits
+# in bits 5-10, so each 2048-entry block (one per reg2 value) repeats every
+# opcode's length for all 32 reg1 values.
+HalfwordLengths = bytearray(b''.join(OpcodeLengths[op:op + 1] * 32 for op in range(64)) * 32)
+HalfwordLengths[0x31 << 5:(0x31 << 5) + 32] = b'\x06' * 32
+HalfwordLengths = bytes(HalfwordLengths)
+
+# Extended (opcode 0x3f) instruction decoders, called with the register
+# fields and both halfwords.
+def decode_ldsr(reg1, reg2, i1, i2):
+    return 'ldsr', 4, reg1, reg2, None, None, None, None
+
+def decode_stsr(reg1, reg2, i1, i2):
+    return 'stsr', 4, reg1, reg2, None, None, None, None
+
+def decode_shr(reg1, reg2, i1, i2):
+    return 'shr', 4, reg1, reg2, None, None, None, None
+
+def decode_shr_reg3(reg1, reg2, i1, i2):
+    return 'shr', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_sar(reg1, reg2, i1, i2):
+    return 'sar', 4, reg1, reg2, None, None, None, None
+
+def decode_sar_reg3(reg1, reg2, i1, i2):
+    return 'sar', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_shl(reg1, reg2, i1, i2):
+    return 'shl', 4, reg1, reg2, None, None, None, None
+
+def decode_shl_reg3(reg1, reg2, i1, i2):
+    return 'shl', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_set1_reg(reg1, reg2, i1, i2):
+    return 'set1', 4, reg1, reg2, None, None, None, None
+
+def decode_not1_reg(reg1, reg2, i1, i2):
+    return 'not1', 4, reg1, reg2, None, None, None, None
+
+def decode_clr1_reg(reg1, reg2, i1, i2):
+    return 'clr1', 4, reg1, reg2, None, None, None, None
+
+def decode_tst1_reg(reg1, reg2, i1, i2):
+    return 'tst1', 4, reg1, reg2, None, None, None, None
+
+def decode_caxi(reg1, reg2, i1, i2):
+    return 'caxi', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_syscall(reg1, reg2, i1, i2):
+    return 'syscall', 4, None, None, None, None, ((i2 >> 11) & 0x7) | (i1 & 0x1f), None
+
+def decode_sasf(reg1, reg2, i1, i2):
+    return 'sasf', 4, None, reg2, None, None, None, reg1 & 0xf
+
+def decode_mul_reg3(reg1, reg2, i1, i2):
+    return 'mul', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_mulu_reg3(reg1, reg2, i1, i2):
+    return 'mulu', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_mul_imm9(reg1, reg2, i1, i2):
+    return 'mul', 4, None, reg2, i2 >> 11, None, SignExtended9[reg1 | ((i2 & 0x3f) << 3)], None
+
+def decode_mulu_imm9(reg1, reg2, i1, i2):
+    return 'mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None
+
+def decode_mul_imm9_reg2(reg1, reg2, i1, i2):
+    return 'mul', 4, reg2, i2 >> 11, None, None, SignExtended9[reg1 | ((i2 & 0x3f) << 3)], None
+
+def decode_mulu_imm9_reg2(reg1, reg2, i1, i2):
+    return 'mulu', 4, reg2, i2 >> 11, None, None, reg1 | ((i2 & 0x3d) << 3), None
+
+def decode_divh(reg1, reg2, i1, i2):
+    return 'divh', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_divhu(reg1, reg2, i1, i2):
+    return 'divhu', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_div(reg1, reg2, i1, i2):
+    return 'div', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_divu(reg1, reg2, i1, i2):
+    return 'divu', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_divq(reg1, reg2, i1, i2):
+    return 'divq', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_divqu(reg1, reg2, i1, i2):
+    return 'divqu', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_bsw(reg1, reg2, i1, i2):
+    return 'bsw', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_bsh(reg1, reg2, i1, i2):
+    return 'bsh', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_hsw(reg1, reg2, i1, i2):
+    return 'hsw', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_hsh(reg1, reg2, i1, i2):
+    return 'hsh', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_sch0r(reg1, reg2, i1, i2):
+    return 'sch0r', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_sch1r(reg1, reg2, i1, i2):
+    return 'sch1r', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_sch0l(reg1, reg2, i1, i2):
+    return 'sch0l', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_sch1l(reg1, reg2, i1, i2):
+    return 'sch1l', 4, reg2, i2 >> 11, None, None, None, None
+
+def decode_satsub_reg3(reg1, reg2, i1, i2):
+    return 'satsub', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_satadd_reg3(reg1, reg2, i1, i2):
+    return 'satadd', 4, reg1, reg2, i2 >> 11, None, None, None
+
+def decode_cmov_imm(reg1, reg2, i1, i2):
+    return 'cmov', 4, reg2, i2 >> 11, None, None, reg1, (((i2 >> 1) & 0xf) ^ _SB5) - _SB5
+
+def decode_cmov_reg(reg1, reg2, i1, i2):
+    return 'cmov', 4, reg2, i2 >> 11, reg1, None, reg1, None
+
+def decode_sbf(reg1, reg2, i1, i2):
+    return 'sbf', 4, reg1, reg2, i2 >> 11, None, reg1, (i2 >> 1) & 0xf
+
+def decode_adf(reg1, reg2, i1, i2):
+    return 'adf', 4, reg1, reg2, i2 >> 11, None, reg1, (i2 >> 1) & 0xf
+
+def decode_mac(reg1, reg2, i1, i2):
+    return 'mac', 4, reg1, reg2, i2 >> 11, i2 & 0x1f, None, None
+
+def decode_macu(reg1, reg2, i1, i2):
+    return 'macu', 4, reg1, reg2, i2 >> 11, i2 & 0x1f, None, None
+
 ExtendedInstructions = {
-    0x01: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0: lambda reg1, reg2, _, _2: ('ldsr', 4, reg1, reg2, None, None, None, None)
-    }),
-    0x02: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0: lambda reg1, reg2, _, _2: ('stsr', 4, reg1, reg2, None, None, None, None)
-    }),
-    0x04: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, _2: ('shr', 4, reg1, reg2, None, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('shr', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x05: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, _2: ('sar', 4, reg1, reg2, None, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('sar', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x06: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, _2: ('shl', 4, reg1, reg2, None, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('shl', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x07: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, _2: ('set1', 4, reg1, reg2, None, None, None, None),
-        0x2: lambda reg1, reg2, _, _2: ('not1', 4, reg1, reg2, None, None, None, None),
-        0x4: lambda reg1, reg2, _, _2: ('clr1', 4, reg1, reg2, None, None, None, None),
-        0x6: lambda reg1, reg2, _, _2: ('tst1', 4, reg1, reg2, None, None, None, None),
-        0xe: lambda reg1, reg2, _, i2: ('caxi', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x0b: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, i1, i2: ('syscall', 4, None, None, None, None, ((i2 >> 11) & 0x7) | (i1 & 0x1f), None),
-    }),
-    0x10: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, _2: ('sasf', 4, None, reg2, None, None, None, reg1 & 0xf),
-    }),
-    0x11: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, i2: ('mul', 4, reg1, reg2, i2 >> 11, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('mulu', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x12: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x4: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x8: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0xc: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x10: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x14: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x18: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x1c: lambda reg1, reg2, _, i2: ('mul', 4, None, reg2, i2 >> 11, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x2: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-        0x6: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-        0xa: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-        0xe: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-        0x12: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-        0x16: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-        0x1a: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-        0x1e: lambda reg1, reg2, _, i2: ('mulu', 4, None, reg2, i2 >> 11, None, reg1 | ((i2 & 0x3d) << 3), None),
-    }),
-    0x13: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, i2: ('mul', 4, reg2, i2 >> 11, None, None, sign_extend(reg1 | ((i2 & 0x3f) << 3), 9), None),
-        0x2: lambda reg1, reg2, _, i2: ('mulu', 4, reg2, i2 >> 11, None, None, reg1 | ((i2 & 0x3d) << 3), None),
-    }),
-    0x14: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, i2: ('divh', 4, reg1, reg2, i2 >> 11, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('divhu', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x16: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, i2: ('div', 4, reg1, reg2, i2 >> 11, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('divu', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x17: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x1c: lambda reg1, reg2, _, i2: ('divq', 4, reg1, reg2, i2 >> 11, None, None, None),
-        0x1e: lambda reg1, reg2, _, i2: ('divqu', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x18: defaultdict(lambda: lambda reg1, reg2, i1, i2: ('cmov', 4, reg2, i2 >> 11, None, None, reg1, sign_extend((i2 >> 1) & 0xf, 5))),
-    0x19: defaultdict(lambda: lambda reg1, reg2, i1, i2: ('cmov', 4, reg2, i2 >> 11, reg1, None, reg1, None)),
-    0x1a: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, i2: ('bsw', 4, reg2, i2 >> 11, None, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('bsh', 4, reg2, i2 >> 11, None, None, None, None),
-        0x4: lambda reg1, reg2, _, i2: ('hsw', 4, reg2, i2 >> 11, None, None, None, None),
-        0x6: lambda reg1, reg2, _, i2: ('hsh', 4, reg2, i2 >> 11, None, None, None, None),
-    }),
-    0x1b: defaultdict(lambda: lambda r1, r2, i1, i2: (None, None, None, None, None, None, None, None), {
-        0x0: lambda reg1, reg2, _, i2: ('sch0r', 4, reg2, i2 >> 11, None, None, None, None),
-        0x2: lambda reg1, reg2, _, i2: ('sch1r', 4, reg2, i2 >> 11, None, None, None, None),
-        0x4: lambda reg1, reg2, _, i2: ('sch0l', 4, reg2, i2 >> 11, None, None, None, None),
-        0x6: lambda reg1, reg2, _, i2: ('sch1l', 4, reg2, i2 >> 11, None, None, None, None),
-    }),
-    0x1c: defaultdict(lambda: lambda reg1, reg2, i1, i2: ('sbf', 4, reg1, reg2, i2 >> 11, None, reg1, (i2 >> 1) & 0xf), {
-        0x1a: lambda reg1, reg2, _, i2: ('satsub', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x1d: defaultdict(lambda: lambda reg1, reg2, i1, i2: ('adf', 4, reg1, reg2, i2 >> 11, None, reg1, (i2 >> 1) & 0xf), {
-        0x1a: lambda reg1, reg2, _, i2: ('satadd', 4, reg1, reg2, i2 >> 11, None, None, None),
-    }),
-    0x1e: defaultdict(lambda: lambda reg1, reg2, i1, i2: ('mac', 4, reg1, reg2, i2 >> 11, i2 & 0x1f, None, None)),
-    0x1f: defaultdict(lambda: lambda reg1, reg2, i1, i2: ('macu', 4, reg1, reg2, i2 >> 11, i2 & 0x1f, None, None)),
+    0x01: {
+        0: decode_ldsr
+    },
+    0x02: {
+        0: decode_stsr
+    },
+    0x04: {
+        0x0: decode_shr,
+        0x2: decode_shr_reg3,
+    },
+    0x05: {
+        0x0: decode_sar,
+        0x2: decode_sar_reg3,
+    },
+    0x06: {
+        0x0: decode_shl,
+        0x2: decode_shl_reg3,
+    },
+    0x07: {
+        0x0: decode_set1_reg,
+        0x2: decode_not1_reg,
+        0x4: decode_clr1_reg,
+        0x6: decode_tst1_reg,
+        0xe: decode_caxi,
+    },
+    0x0b: {
+        0x0: decode_syscall,
+    },
+    0x10: {
+        0x0: decode_sasf,
+    },
+    0x11: {
+        0x0: decode_mul_reg3,
+        0x2: decode_mulu_reg3,
+    },
+    0x12: {
+        0x0: decode_mul_imm9,
+        0x4: decode_mul_imm9,
+        0x8: decode_mul_imm9,
+        0xc: decode_mul_imm9,
+        0x10: decode_mul_imm9,
+        0x14: decode_mul_imm9,
+        0x18: decode_mul_imm9,
+        0x1c: decode_mul_imm9,
+        0x2: decode_mulu_imm9,
+        0x6: decode_mulu_imm9,
+        0xa: decode_mulu_imm9,
+        0xe: decode_mulu_imm9,
+        0x12: decode_mulu_imm9,
+        0x16: decode_mulu_imm9,
+        0x1a: decode_mulu_imm9,
+        0x1e: decode_mulu_imm9,
+    },
+    0x13: {
+        0x0: decode_mul_imm9_reg2,
+        0x2: decode_mulu_imm9_reg2,
+    },
+    0x14: {
+        0x0: decode_divh,
+        0x2: decode_divhu,
+    },
+    0x16: {
+        0x0: decode_div,
+        0x2: decode_divu,
+    },
+    0x17: {
+        0x1c: decode_divq,
+        0x1e: decode_divqu,
+    },
+    0x18: {},
+    0x19: {},
+    0x1a: {
+        0x0: decode_bsw,
+        0x2: decode_bsh,
+        0x4: decode_hsw,
+        0x6: decode_hsh,
+    },
+    0x1b: {
+        0x0: decode_sch0r,
+        0x2: decode_sch1r,
+        0x4: decode_sch0l,
+        0x6: decode_sch1l,
+    },
+    0x1c: {
+        0x1a: decode_satsub_reg3,
+    },
+    0x1d: {
+        0x1a: decode_satadd_reg3,
+    },
+    0x1e: {},
+    0x1f: {},
 }
 
+# Extended sub-opcodes whose remaining sub-sub-opcodes all decode to one
+# instruction, spread over every unclaimed slot of the tables above.
+ExtendedInstructionDefaults = {
+    0x18: decode_cmov_imm,
+    0x19: decode_cmov_reg,
+    0x1c: decode_sbf,
+    0x1d: decode_adf,
+    0x1e: decode_mac,
+    0x1f: decode_macu,
+}
+
+for subop, fn in ExtendedInstructionDefaults.items():
+    for sub_subop in range(0x20):
+        ExtendedInstructions[subop].setdefault(sub_subop, fn)
+
 ConditionCode = [
     'v', 'l', 'z', 'nh',
     'n', 't', 'lt', 'le',
@@ -362,14 +617,27 @@ ConditionCode = [
     'p', 'sa', 'ge', 'gt'
 ]
 
-BranchConditionCode = [
+BranchConditionCode = (
     'bv', 'bl', 'be', 'bnh',
     'bn', 'br', 'blt', 'ble',
     'bnv', 'bnl', 'bne', 'bh',
     'bp', 'bsa', 'bge', 'bgt'
-]
+)
+
+BranchInstructions = frozenset(BranchConditionCode)
+
+ReturnInstructions = frozenset(['feret', 'eiret', 'ctret', 'reti'])
+
+# Instructions the lifter treats as no-ops.
+NopInstructions = frozenset(['nop', 'synce', 'syncm', 'syncp', 'di', 'ei'])
 
-BranchConditionToILCondition = [
+AndInstructions = frozenset(['and', 'andi'])
+OrInstructions = frozenset(['or', 'ori'])
+XorInstructions = frozenset(['xor', 'xori'])
+
+# IL flag condition for each branch condition index (the low nibble of the
+# Bcond opcode), which decode stores in the record's cond field.
+BranchConditionToILCondition = (
     LowLevelILFlagCondition.LLFC_O,
     LowLevelILFlagCondition.LLFC_ULT,
     LowLevelILFlagCondition.LLFC_E,
@@ -386,10 +654,241 @@ BranchConditionToILCondition = [
     None, # Saturated
     LowLevelILFlagCondition.LLFC_SGE,
     LowLevelILFlagCondition.LLFC_SGT,
-]
+)
 
 StorageSize = {'b': 1, 'h': 2, 'w': 4, 'bu': 1, 'hu': 2}
 
+# Memory access size of every load/store mnemonic.
+AccessSize = dict((mnem, StorageSize[mnem.split('.')[1]]) for mnem in LoadInstructions | StoreInstructions)
+
+_TT = InstructionTextTokenType
+_TxtTok = _TT.TextToken
+_SepTok = _TT.OperandSeparatorToken
+_RegTok = _TT.RegisterToken
+_IntTok = _TT.IntegerToken
+_AddrTok = _TT.PossibleAddressToken
+
+# Tokens that never change between instructions are built once and shared.
+RegisterTokens = [InstructionTextToken(_RegTok, name) for name in Registers]
+COMMA_TOK = InstructionTextToken(_SepTok, ', ')
+LBRACKET_TOK = InstructionTextToken(_SepTok, '[')
+RBRACKET_TOK = InstructionTextToken(_SepTok, ']')
+RBRACKET_COMMA_TOK = InstructionTextToken(_SepTok, '], ')
+LBRACE_TOK = InstructionTextToken(_SepTok, '{')
+RBRACE_COMMA_TOK = InstructionTextToken(_SepTok, '}, ')
+COMMA_LBRACE_TOK = InstructionTextToken(_SepTok, ', {')
+RBRACE_TOK = InstructionTextToken(_SepTok, '}')
+# Immediate operands are followed by a plain text comma rather than a separator.
+TEXT_COMMA_TOK = InstructionTextToken(_TxtTok, ', ')
+
+# Integer operand tokens for the displacements and immediates that make up
+# almost all of real code, so those are shared instead of formatted per call.
+IntegerTokens = dict((value, InstructionTextToken(_IntTok, hex(value), value)) for value in range(-256, 4096))
+
+def int_token(value):
+    token = IntegerTokens.get(value)
+    if token is None:
+        token = InstructionTextToken(_IntTok, hex(value), value)
+    return token
+
+# Padded mnemonic tokens for every mnemonic the decoder produces, built up
+# front. The last set lists the ones that only appear as string literals in the
+# decode_* functions. get_instruction_text still adds any mnemonic missing here
+# the first time it is rendered.
+MnemonicTokens = {}
+for mnem in (OneRegInstructions | TwoRegInstructions | RegImmediateInstructions |
+             ImmediateRegRegInstructions | LoadInstructions | StoreInstructions |
+             MulInstructions | frozenset(BranchConditionCode) |
+             frozenset(NoRegisterInstructions.values()) |
+             frozenset(ThirtyTwoBitNoRegisterInstructions.values()) |
+             frozenset(mnem for mnem in TypeOneRegRegInstructions if mnem is not None) |
+             frozenset(['jmp', 'jr', 'jarl', 'prepare', 'dispose', 'setf', 'rie']) |
+             frozenset(['adf', 'bsh', 'bsw', 'callt', 'caxi', 'clr1', 'cmov', 'div',
+                        'divhu', 'divq', 'divqu', 'divu', 'fetrap', 'hsh', 'hsw', 'ldsr',
+                        'mac', 'macu', 'not1', 'sasf', 'sbf', 'sch0l', 'sch0r', 'sch1l',
+                        'sch1r', 'set1', 'stsr', 'syscall', 'tst1'])):
+    MnemonicTokens[mnem] = InstructionTextToken(_TxtTok, '{:8s}'.format(mnem))
+
+# Per-mnemonic operand formatters for get_instruction_text. Each appends the
+# operand tokens of a decoded instruction to the token list.
+def _emit_one_reg(tokens, insn, addr):
+    if insn.dst_reg is not None:
+        tokens.append(RegisterTokens[insn.dst_reg])
+
+def _emit_two_reg(tokens, insn, addr):
+    src_reg, dst_reg = insn.src_reg, insn.dst_reg
+    if src_reg is not None and dst_reg is not None and insn.immed is None:
+        tokens.extend((RegisterTokens[src_reg], COMMA_TOK, RegisterTokens[dst_reg]))
+
+def _emit_reg_immediate(tokens, insn, addr):
+    dst_reg, immed = insn.dst_reg, insn.immed
+    if insn.src_reg is None and dst_reg is not None and immed is not None:
+        tokens.extend((
+            InstructionTextToken(_AddrTok, hex(immed), immed),
+            TEXT_COMMA_TOK,
+            RegisterTokens[dst_reg],
+        ))
+
+def _emit_two_reg_or_reg_immediate(tokens, insn, addr):
+    _emit_two_reg(tokens, insn, addr)
+    _emit_reg_immediate(tokens, insn, addr)
+
+def _emit_immediate_reg_reg(tokens, insn, addr):
+    src_reg, dst_reg, immed = insn.src_reg, insn.dst_reg, insn.immed
+    if src_reg is not None and dst_reg is not None and immed is not None:
+        tokens.extend((
+            int_token(immed),
+            TEXT_COMMA_TOK,
+            RegisterTokens[src_reg],
+            COMMA_TOK,
+            RegisterTokens[dst_reg],
+        ))
+
+def _emit_load(tokens, insn, addr):
+    immed = insn.immed
+    tokens.extend((
+        int_token(immed),
+        LBRACKET_TOK,
+        RegisterTokens[insn.src_reg],
+        RBRACKET_COMMA_TOK,
+        RegisterTokens[insn.dst_reg],
+    ))
+
+def _emit_store(tokens, insn, addr):
+    immed = insn.immed
+    tokens.extend((
+        RegisterTokens[insn.src_reg],
+        COMMA_TOK,
+        int_token(immed),
+        LBRACKET_TOK,
+        RegisterTokens[insn.dst_reg],
+        RBRACKET_TOK,
+    ))
+
+def _emit_mul(tokens, insn, addr):
+    immed = insn.immed
+    if immed is not None:
+        tokens.append(InstructionTextToken(_AddrTok, hex(immed), immed))
+    else:
+        tokens.append(RegisterTokens[insn.src_reg])
+    tokens.extend((COMMA_TOK, RegisterTokens[insn.dst_reg], COMMA_TOK, RegisterTokens[insn.reg3]))
+
+def _emit_jmp(tokens, insn, addr):
+    immed = insn.immed
+    if immed is not None:
+        tokens.append(InstructionTextToken(_AddrTok, hex(immed), immed))
+    tokens.extend((
+        LBRACKET_TOK,
+        RegisterTokens[insn.dst_reg],
+        RBRACKET_TOK,
+    ))
+
+def _emit_branch(tokens, insn, addr):
+    # TODO - consider what the best place to fix up immediates is
+    branch_target = insn.immed + addr
+    tokens.append(InstructionTextToken(_AddrTok, hex(branch_target), branch_target))
+
+def _emit_jarl(tokens, insn, addr):
+    branch_target = insn.immed + addr
+    tokens.extend((
+        InstructionTextToken(_AddrTok, hex(branch_target), branch_target),
+        COMMA_TOK,
+        RegisterTokens[insn.dst_reg],
+    ))
+
+def register_list_tokens(registers):
+    tokens = []
+    for regname in registers:
+        tokens.extend((RegisterTokens[RegisterIndex[regname]], COMMA_TOK))
+    return tuple(tokens[:-1])
+
+# Comma separated register tokens for every possible prepare/dispose register
+# list.
+RegisterListTokens = tuple(register_list_tokens(registers) for registers in RegisterLists)
+
+def _emit_prepare(tokens, insn, addr):
+    src_reg = insn.src_reg
+    tokens.append(LBRACE_TOK)
+    tokens.extend(RegisterListTokens[insn.dst_reg])
+    tokens.extend((RBRACE_COMMA_TOK, int_token(insn.immed)))
+    if src_reg is not None:
+        if insn.length == 4:
+            tokens.extend((COMMA_TOK, RegisterTokens[src_reg]))
+        else:
+            tokens.extend((COMMA_TOK, InstructionTextToken(_IntTok, hex(src_reg))))
+
+def _emit_dispose(tokens, insn, addr):
+    immed = insn.immed
+    tokens.extend((
+        int_token(immed),
+        COMMA_LBRACE_TOK,
+    ))
+    tokens.extend(RegisterListTokens[insn.dst_reg])
+    tokens.append(RBRACE_TOK)
+    if insn.src_reg is not None:
+        tokens.extend((COMMA_TOK, RegisterTokens[insn.src_reg]))
+
+TextEmitters = {}
+for mnem in OneRegInstructions:
+    TextEmitters[mnem] = _emit_one_reg
+for mnem in TwoRegInstructions:
+    TextEmitters[mnem] = _emit_two_reg
+for mnem in RegImmediateInstructions:
+    # mov, add, cmp, ... have both a register and an immediate form
+    if mnem in TwoRegInstructions:
+        TextEmitters[mnem] = _emit_two_reg_or_reg_immediate
+    else:
+        TextEmitters[mnem] = _emit_reg_immediate
+for mnem in ImmediateRegRegInstructions:
+    TextEmitters[mnem] = _emit_immediate_reg_reg
+for mnem in LoadInstructions:
+    TextEmitters[mnem] = _emit_load
+for mnem in StoreInstructions:
+    TextEmitters[mnem] = _emit_store
+for mnem in MulInstructions:
+    TextEmitters[mnem] = _emit_mul
+for mnem in BranchInstructions:
+    TextEmitters[mnem] = _emit_branch
+TextEmitters['jmp'] = _emit_jmp
+TextEmitters['jr'] = _emit_branch
+TextEmitters['jarl'] = _emit_jarl
+TextEmitters['prepare'] = _emit_prepare
+TextEmitters['dispose'] = _emit_dispose
+
+# Per-mnemonic branch edges for get_instruction_info. Instructions that do not
+# change control flow have no entry.
+def _info_conditional_branch(result, insn, addr):
+    result.add_branch(BranchType.TrueBranch, insn.immed + addr)
+    result.add_branch(BranchType.FalseBranch, addr + insn.length)
+
+def _info_unconditional_branch(result, insn, addr):
+    result.add_branch(BranchType.UnconditionalBranch, insn.immed + addr)
+
+def _info_call(result, insn, addr):
+    result.add_branch(BranchType.CallDestination, insn.immed + addr)
+
+def _info_indirect_branch(result, insn, addr):
+    # if insn.dst_reg == Registers.index('lp'):
+    #     result.add_branch(BranchType.FunctionReturn)
+    result.add_branch(BranchType.IndirectBranch)
+
+def _info_return(result, insn, addr):
+    result.add_branch(BranchType.FunctionReturn)
+
+def _info_dispose(result, insn, addr):
+    if insn.dst_reg is not None:
+        result.add_branch(BranchType.FunctionReturn)
+
+BranchHandlers = dict((mnem, _info_conditional_branch) for mnem in BranchInstructions)
+BranchHandlers['br'] = _info_unconditional_branch
+BranchHandlers['jr'] = _info_unconditional_branch
+BranchHandlers['jarl'] = _info_call
+BranchHandlers['jmp'] = _info_indirect_branch
+BranchHandlers['switch'] = _info_indirect_branch
+BranchHandlers['dispose'] = _info_dispose
+for mnem in ReturnInstructions:
+    BranchHandlers[mnem] = _info_return
+
 def to_il_src_reg(il, reg, width=4):
     return il.reg(width, Registers[reg]) if reg != 0 else il.const(0, 0)
 
@@ -399,23 +898,333 @@ def to_il_dst_reg(il, reg):
 def to_il_set_reg(il, reg, val):
     return il.set_reg(4, reg, val) if reg != 'r0' else val
 
-def cond_branch(il, cond, dest):
+# Moves sp by a constant number of bytes; prepare allocates with a negative
+# delta and dispose frees with a positive one.
+def adjust_sp(il, delta):
+    if delta > 0:
+        il.append(il.set_reg(4, 'sp', il.add(4, il.reg(4, 'sp'), il.const(4, delta))))
+    elif delta < 0:
+        il.append(il.set_reg(4, 'sp', il.sub(4, il.reg(4, 'sp'), il.const(4, -delta))))
+
+# The registered V850 architecture object, looked up once on first use since
+# the plugin registers the architecture after this module's functions exist.
+_ArchCache = {}
+
+def _arch():
+    v850 = _ArchCache.get('v850')
+    if v850 is None:
+        v850 = _ArchCache['v850'] = Architecture['V850']
+    return v850
+
+def cond_branch(il, cond, dest, fallthrough=None):
     t = None
     if il[dest].operation == LowLevelILOperation.LLIL_CONST:
-        t = il.get_label_for_address(Architecture['V850'], il[dest].constant)
+        t = il.get_label_for_address(_arch(), il[dest].constant)
     if t is None:
         t = LowLevelILLabel()
         indirect = True
     else:
         indirect = False
-    f = LowLevelILLabel()
+    # Branch straight to the next instruction's label when it already has one
+    # rather than allocating and marking a new label in front of it.
+    f = None
+    if fallthrough is not None:
+        f = il.get_label_for_address(_arch(), fallthrough)
+    if f is None:
+        f = LowLevelILLabel()
+        mark_false = True
+    else:
+        mark_false = False
     il.append(il.if_expr(cond, t, f))
     if indirect:
         il.mark_label(t)
         il.append(il.jump(dest))
-    il.mark_label(f)
+    if mark_false:
+        il.mark_label(f)
     return None
 
+# Shift mnemonic -> (IL shift operation, size and value of the mask that picks
+# the last bit shifted out, IL operation that moves that bit under the mask).
+ShiftOperations = {
+    'shr': ('logical_shift_right', 1, 1, 'logical_shift_right'),
+    'sar': ('arith_shift_right', 1, 1, 'logical_shift_right'),
+    'shl': ('shift_left', 4, 0x80000000, 'shift_left'),
+}
+
+def shift_il(il, instr, src_reg, dst_reg, reg3, immed):
+    shift_op, carry_size, carry_mask, carry_op = ShiftOperations[instr]
+    shiftee = to_il_src_reg(il, dst_reg)
+    shift_amount = il.const(4, immed) if immed is not None else to_il_src_reg(il, src_reg)
+    store_in = Registers[dst_reg] if reg3 is None else Registers[reg3]
+
+    shift_expr = getattr(il, shift_op)(4, shiftee, shift_amount, flags='*')
+    il.append(to_il_set_reg(il, store_in, shift_expr))
+    # TODO - find a better way of doing this? it falls over if shift amount is 0
+    il.append(il.set_flag('cy',
+        il.and_expr(1,
+            il.const(carry_size, carry_mask),
+            getattr(il, carry_op)(4, shiftee, il.sub(4, shift_amount, il.const(1, 1))))))
+    il.append(il.set_flag('ov', il.const(0, 0)))
+
+# IL lifters for the most frequent mnemonics. Each takes the IL function, the
+# decoded instruction and its address; get_instruction_low_level_il tries these
+# before falling back to its chain of comparisons for everything else.
+def _lift_br(il, insn, addr):
+    il.append(il.jump(il.const(4, insn.immed + addr)))
+
+def _lift_conditional_branch(il, insn, addr):
+    cond = il.flag_condition(BranchConditionToILCondition[insn.cond])
+    cond_branch(il, cond, il.const(4, insn.immed + addr), addr + insn.length)
+
+def _lift_mov(il, insn, addr):
+    src_reg = insn.src_reg
+    if src_reg is not None:
+        il.append(to_il_set_reg(il, Registers[insn.dst_reg], to_il_src_reg(il, src_reg)))
+    else:
+        il.append(to_il_set_reg(il, Registers[insn.dst_reg], il.const(4, insn.immed)))
+
+def _lift_store(il, insn, addr):
+    il.append(il.store(AccessSize[insn.instr],
+        il.add(4, to_il_src_reg(il, insn.dst_reg), il.const(4, insn.immed)),
+        to_il_src_reg(il, insn.src_reg)))
+
+def _lift_load(il, insn, addr):
+    instr = insn.instr
+    if instr[-1] == 'u':
+        extend = il.zero_extend
+    else:
+        extend = il.sign_extend
+    il.append(to_il_set_reg(il, Registers[insn.dst_reg],
+        extend(4,
+            il.load(AccessSize[instr],
+            il.add(4, to_il_src_reg(il, insn.src_reg), il.const(4, insn.immed))))))
+
+def _lift_movea(il, insn, addr):
+    il.append(to_il_set_reg(il, Registers[insn.dst_reg],
+        il.add(4, to_il_src_reg(il, insn.src_reg), il.const(4, insn.immed))))
+
+def _lift_add(il, insn, addr):
+    dst_reg, immed = insn.dst_reg, insn.immed
+    src = to_il_src_reg(il, insn.src_reg) if immed is None else il.const(4, immed)
+    il.append(to_il_set_reg(il, Registers[dst_reg], il.add(4, src, to_il_src_reg(il, dst_reg), flags='*')))
+
+def _lift_addi(il, insn, addr):
+    op1 = to_il_src_reg(il, insn.src_reg)
+    op2 = il.const(4, insn.immed)
+    il.append(to_il_set_reg(il, Registers[insn.dst_reg], il.add(4, op2, op1, flags='*')))
+
+def _lift_sub(il, insn, addr):
+    dst_reg = insn.dst_reg
+    il.append(to_il_set_reg(il, Registers[dst_reg], il.sub(4, to_il_src_reg(il, dst_reg), to_il_src_reg(il, insn.src_reg), flags='*')))
+
+def _lift_cmp(il, insn, addr):
+    immed = insn.immed
+    src = to_il_src_reg(il, insn.src_reg) if immed is None else il.const(4, immed)
+    il.append(il.sub(4, to_il_src_reg(il, insn.dst_reg), src, flags='*'))
+
+FastLifters = {
+    'mov': _lift_mov,
+    'movea': _lift_movea,
+    'add': _lift_add,
+    'addi': _lift_addi,
+    'sub': _lift_sub,
+    'cmp': _lift_cmp,
+}
+for mnem in BranchInstructions:
+    FastLifters[mnem] = _lift_conditional_branch
+FastLifters['br'] = _lift_br
+for mnem in StoreInstructions:
+    FastLifters[mnem] = _lift_store
+for mnem in LoadInstructions:
+    FastLifters[mnem] = _lift_load
+
+# Per-opcode decoders. Each takes the first halfword, its reg1/reg2 fields and
+# the following halfwords (None past the end of the data) and returns the full
+# (instr, length, src_reg, dst_reg, reg3, reg4, immed, cond) tuple.
+def reg_reg_decoder(mnem):
+    def decode_reg_reg(i1, reg1, reg2, i2, i3, i4):
+        return mnem, 2, reg1, reg2, None, None, None, None
+    return decode_reg_reg
+
+def reg_reg_alias_decoder(fn):
+    def decode_reg_reg_alias(i1, reg1, reg2, i2, i3, i4):
+        instr, src, dst = fn(reg1, reg2)
+        return instr, 2, src, dst, None, None, None, None
+    return decode_reg_reg_alias
+
+def immediate_reg_decoder(fn):
+    def decode_immediate_reg(i1, reg1, reg2, i2, i3, i4):
+        instr, immed, dst = fn(reg1, reg2)
+        return instr, 2, None, dst, None, None, immed, None
+    return decode_immediate_reg
+
+def short_load_store_decoder(fn, mask, shift):
+    def decode_short_load_store(i1, reg1, reg2, i2, i3, i4):
+        instr, src, dst, immed = fn(reg2, (i1 & mask) << shift)
+        return instr, 2, src, dst, None, None, immed, None
+    return decode_short_load_store
+
+# sld.w / sst.w, selected by bit 0 of the instruction.
+ShortWordDecoders = (
+    short_load_store_decoder(*TypeFourShortLoadStoreInstructions[0xa]),
+    short_load_store_decoder(lambda reg2, disp: ('sst.w', reg2, EP_IDX, disp), 0x7e, 1),
+)
+
+def decode_short_word(i1, reg1, reg2, i2, i3, i4):
+    return ShortWordDecoders[i1 & 0x1](i1, reg1, reg2, i2, i3, i4)
+
+def simple_thirty_two_bit_decoder(fn):
+    def decode_simple_thirty_two_bit(i1, reg1, reg2, i2, i3, i4):
+        if i2 is None:
+            return ERROR_TUPLE
+        return fn(reg1, reg2, i1, i2, i3)
+    return decode_simple_thirty_two_bit
+
+# Wraps the decoder of an opcode that also encodes a zero-register instruction
+# (nop, synce, ... share opcode 0x00 with mov; rie shares 0x02 with divh), so
+# only those opcodes pay for the NoRegisterInstructions lookup.
+def no_register_decoder(fn):
+    def decode_no_register(i1, reg1, reg2, i2, i3, i4):
+        instr = NoRegisterInstructions.get(i1)
+        if instr is not None:
+            return instr, 2, None, None, None, None, None, None
+        return fn(i1, reg1, reg2, i2, i3, i4)
+    return decode_no_register
+
+# 0x03: jmp [reg1], sld.bu, sld.hu
+def decode_opcode_03(i1, reg1, reg2, i2, i3, i4):
+    if reg2 == 0:
+        return 'jmp', 2, None, reg1, None, None, None, None
+    if reg1 & 0x10 == 0x10:
+        return 'sld.hu', 2, EP_IDX, reg2, None, None, (reg1 & 0xf) << 1, None
+    return 'sld.bu', 2, EP_IDX, reg2, None, None, reg1 & 0xf, None
+
+def decode_branch(i1, reg1, reg2, i2, i3, i4):
+    disp = (reg2 << 3) | ((i1 >> 4) & 0x7)
+    cond = i1 & 0xf
+    return BranchConditionCode[cond], 2, None, None, None, None, SignExtended9[disp << 1], cond
+
+# 0x17: mulh, jr, jarl
+def decode_opcode_17(i1, reg1, reg2, i2, i3, i4):
+    if reg2 != 0:
+        return 'mulh', 2, None, reg2, None, None, (reg1 ^ _SB5) - _SB5, None
+    if i3 is None:
+        return ERROR_TUPLE
+    if reg1 == 0:
+        return 'jr', 6, None, None, None, None, (((i3 << 16) | i2) ^ _SB32) - _SB32, None
+    return 'jarl', 6, None, reg1, None, None, (((i3 << 16) | i2) ^ _SB32) - _SB32, None
+
+def decode_long_load_store(i1, reg1, reg2, i2, i3, i4):
+    if i2 is None:
+        return ERROR_TUPLE
+    return decode_3c_and_3d(i1, i2, i3, i4)
+
+def decode_bit_manipulation(i1, reg1, reg2, i2, i3, i4):
+    if i2 is None:
+        return ERROR_TUPLE
+    return BitManipulationInstructions[i1 >> 14](reg1, (i1 >> 11) & 0x7, i2)
+
+def decode_opcode_3f(i1, reg1, reg2, i2, i3, i4):
+    if i2 is None:
+        return ERROR_TUPLE
+
+    instr = ThirtyTwoBitNoRegisterInstructions.get(i1 << 16 | i2)
+    if instr is not None:
+        return instr, 4, None, None, None, None, None, None
+
+    if i2 & 0x1 == 0x1:
+        disp = (i2 & 0xfffe)
+        return 'ld.hu', 4, reg1, reg2, None, None, (disp ^ _SB16) - _SB16, None
+
+    if i2 == 0:
+        if reg1 & 0x10 == 0:
+            return 'setf', 4, reg1, reg2, None, None, None, None
+        else:
+            return 'rie', 4, reg2, reg1 & 0xf, None, None, None, None
+
+    table = ExtendedInstructions.get((i2 >> 5) & 0x3f)
+    if table is None:
+        return ERROR_TUPLE
+    handler = table.get(i2 & 0x1f)
+    if handler is None:
+        return ERROR_TUPLE
+    return handler(reg1, reg2, i1, i2)
+
+def decode_invalid(i1, reg1, reg2, i2, i3, i4):
+    return ERROR_TUPLE
+
+# Flat opcode -> decoder table so decode() does a single index and call
+# instead of walking the instruction dicts. Built once at import.
+DecodeTable = [decode_invalid] * 64
+for op, mnem in enumerate(TypeOneRegRegInstructions):
+    if mnem is not None:
+        DecodeTable[op] = reg_reg_decoder(mnem)
+for op, fn in TypeOneRegRegAliasInstructions.items():
+    DecodeTable[op] = reg_reg_alias_decoder(fn)
+for op, fn in TypeOneImmediateRegInstructions.items():
+    DecodeTable[op] = immediate_reg_decoder(fn)
+for op in range(0x18, 0x28):
+    DecodeTable[op] = short_load_store_decoder(*TypeFourShortLoadStoreInstructions[op >> 2])
+for op in range(0x28, 0x2c):
+    DecodeTable[op] = decode_short_word
+for op in range(0x2c, 0x30):
+    DecodeTable[op] = decode_branch
+for op, fn in SimpleThirtyTwoBitInstructions.items():
+    DecodeTable[op] = simple_thirty_two_bit_decoder(fn)
+DecodeTable[0x03] = decode_opcode_03
+DecodeTable[0x17] = decode_opcode_17
+DecodeTable[0x3c] = decode_long_load_store
+DecodeTable[0x3d] = decode_long_load_store
+DecodeTable[0x3e] = decode_bit_manipulation
+DecodeTable[0x3f] = decode_opcode_3f
+for op in set((instruction >> 5) & 0x3f for instruction in NoRegisterInstructions):
+    DecodeTable[op] = no_register_decoder(DecodeTable[op])
+
+def decode(data):
+    if len(data) < 2:
+        return ERROR_TUPLE
+
+    if len(data) >= 8:
+        instruction, instruction2, instruction3, instruction4 = _U4H_FROM(data)
+    else:
+        instruction, instruction2, instruction3, instruction4 = _ShortReads[len(data) >> 1](data)
+
+    # return instr, length, src_reg, dst_reg, reg3, reg4, immed, cond
+    return DecodeTable[(instruction >> 5) & 0x3f](
+        instruction, instruction & 0x1f, (instruction >> 11) & 0x1f,
+        instruction2, instruction3, instruction4)
+
+# Decoded form of a single instruction. Instances are shared through the decode
+# cache, so they must be treated as read-only.
+class DecodedInstruction(object):
+    __slots__ = ('instr', 'length', 'src_reg', 'dst_reg', 'reg3', 'reg4', 'immed', 'cond')
+
+    def __init__(self, instr, length, src_reg, dst_reg, reg3, reg4, immed, cond):
+        self.instr = instr
+        self.length = length
+        self.src_reg = src_reg
+        self.dst_reg = dst_reg
+        self.reg3 = reg3
+        self.reg4 = reg4
+        self.immed = immed
+        self.cond = cond
+
+# Decoding only depends on the instruction bytes, so results are shared between
+# the info/text/IL callbacks (and between identical instructions at different
+# addresses). The cache is direct-mapped: each slot holds one (bytes, decoded)
+# pair and a colliding instruction simply replaces it. Slots are indexed by a
+# Fibonacci hash of the bytes so that neighbouring encodings spread out.
+DECODE_CACHE_BITS = 12
+DECODE_CACHE_SIZE = 1 << DECODE_CACHE_BITS
+_DECODE_CACHE_SHIFT = 64 - DECODE_CACHE_BITS
+_decode_cache = [(None, None)] * DECODE_CACHE_SIZE
+
+# Lift "movhi hi, r0, rX; movea lo, rX, rX" (the usual 32-bit constant load) as
+# a single constant assignment covering both instructions, unless the movea is
+# itself a branch target. Turn this off to get one IL instruction per machine
+# instruction, e.g. when debugging the lifter.
+FUSE_CONST_LOAD = True
+
 class V850(Architecture):
     name = 'V850'
     address_size = 4
@@ -496,134 +1305,36 @@ class V850(Architecture):
     }
 
     def decode_instruction(self, data, addr):
-        error_value = (None, None, None, None, None, None, None, None)
-        if len(data) < 2:
-            return error_value
-
-        instruction = struct.unpack('<H', data[0:2])[0]
-        # is this a zero-register instruction?
-        if instruction in NoRegisterInstructions:
-            return (NoRegisterInstructions[instruction], 2, None, None, None, None, None, None)
-
-        opcode = (instruction >> 5) & 0x3f
-        reg1 = (instruction & 0x1f)
-        reg2 = (instruction >> 11) & 0x1f
-
-        if opcode in TypeOneRegRegInstructions:
-            instr, src, dst = TypeOneRegRegInstructions[opcode](reg1, reg2)
-            if instr == 'mov' and reg2 is None:
-                return error_value
-            return (instr, 2, src, dst, None, None, None, None)
-
-        if opcode in TypeOneImmediateRegInstructions:
-            instr, immed, dst = TypeOneImmediateRegInstructions[opcode](reg1, reg2)
-            return (instr, 2, None, dst, None, None, immed, None)
-
-        # 0x17: mulh, jr, jarl
-        if opcode == 0x17:
-            if reg1 == reg2 == 0:
-                return 'jr', 6, None, None, None, None, (struct.unpack('<H', data[4:6])[0] << 16) | struct.unpack('<H', data[2:4])[0], None
-            if reg2 == 0:
-                return 'jarl', 6, None, reg1, None, None, sign_extend((struct.unpack('<H', data[4:6])[0] << 16) | struct.unpack('<H', data[2:4])[0], 32), None
-            else:
-                return 'mulh', 2, None, reg2, None, None, sign_extend(reg1, 5), None
-
-        # Handle short load store instructions
-        if opcode >= 0x18 and opcode <= 0x2b:
-            disp = instruction & 0x7f
-            load_store_type = opcode >> 2
-            instr, src, dst, immed = TypeFourShortLoadStoreInstructions[load_store_type](reg2, disp)
-            return instr, 2, src, dst, None, None, immed, None
-
-        # Handle branches
-        if opcode >= 0x2c and opcode <= 0x2f:
-            disp = (reg2 << 3) | ((instruction >> 4) & 0x7)
-            return BranchConditionCode[instruction & 0xf], 2, None, None, None, None, sign_extend(disp << 1, 9), None
-
-        instruction2 = struct.unpack('<H', data[2:4])[0]
-        instruction_word = instruction << 16 | instruction2
-
-        if instruction_word in ThirtyTwoBitNoRegisterInstructions:
-            return ThirtyTwoBitNoRegisterInstructions[instruction_word], 4, None, None, None, None, None, None
-
-        if opcode in SimpleThirtyTwoBitInstructions:
-            if len(data) >= 6:
-                instruction3 = struct.unpack('<H', data[4:6])[0]
-            else:
-                instruction3 = None
-            instr, size, src, dst, immed = SimpleThirtyTwoBitInstructions[opcode](reg1, reg2, instruction, instruction2, instruction3)
-            return instr, size, src, dst, None, None, immed, None
-
-        if opcode == 0x3c or opcode == 0x3d:
-            instr, size, src, dst, immed = decode_3c_and_3d(data)
-            return instr, size, src, dst, None, None, immed, None
-
-        if opcode == 0x3e:
-            bitop = instruction >> 14
-            bitnum = (instruction >> 11) & 0x7
-            instr, size, src, dst, immed = BitManipulationInstructions[bitop](reg1, bitnum, instruction2)
-            return instr, size, src, dst, None, None, immed, None
-
-        if opcode == 0x3f and instruction2 & 0x1 == 0x1:
-            disp = (instruction2 & 0xfffe)
-            return 'ld.hu', 4, reg1, reg2, None, None, sign_extend(disp, 16), None
-
-        if opcode == 0x3f and instruction2 == 0:
-            if reg1 & 0x10 == 0:
-                return 'setf', 4, reg1, reg2, None, None, None, None
-            else:
-                return 'rie', 4, reg2, reg1 & 0xf, None, None, None, None
-
-        subop = (instruction2 >> 5) & 0x3f
-        if opcode == 0x3f and subop in ExtendedInstructions:
-            sub_subop = instruction2 & 0x1f
-            instr, size, src, dst, r3, r4, immed, cond = ExtendedInstructions[subop][sub_subop](reg1, reg2, instruction, instruction2)
-            return instr, size, src, dst, r3, r4, immed, cond
-
-        # return instr, length, src_reg, dst_reg, reg3, reg4, immed, cond
-        return error_value
+        key = data[:8]
+        slot = ((int.from_bytes(key, 'little') * 0x9e3779b97f4a7c15) & 0xffffffffffffffff) >> _DECODE_CACHE_SHIFT
+        cached_key, result = _decode_cache[slot]
+        if cached_key != key:
+            result = DecodedInstruction(*decode(data))
+            _decode_cache[slot] = (key, result)
+        return result
+
     # def _get_link_register(self, ctxt):
     #     print(ctxt)
     #     return Registers.index('lp')
 
     def get_instruction_info(self, data, addr):
-        instr, length, src_reg, dst_reg, reg3, reg4, immed, cond = self.decode_instruction(data, addr)
+        if len(data) >= 2:
+            length = HalfwordLengths[data[0] | data[1] << 8]
+            if length and len(data) >= length:
+                result = InstructionInfo()
+                result.length = length
+                return result
+
+        insn = self.decode_instruction(data, addr)
+        instr = insn.instr
         if instr is None:
             return None
-
         result = InstructionInfo()
-        result.length = length
-
-
-        if instr[0] == 'b' and instr != 'bsw' and instr != 'bsh':
-            branch_target = sign_extend(immed, 32) + addr
-            if instr == 'br':
-                result.add_branch(BranchType.UnconditionalBranch, branch_target)
-            else:
-                result.add_branch(BranchType.TrueBranch, branch_target)
-                result.add_branch(BranchType.FalseBranch, addr + length)
-
-        elif instr == 'jmp':
-            # if dst_reg == Registers.index('lp'):
-            #     result.add_branch(BranchType.FunctionReturn)
-            # else:
-                result.add_branch(BranchType.IndirectBranch)
+        result.length = insn.length
 
-        elif instr == 'jarl':
-            branch_target = sign_extend(immed, 32) + addr
-            result.add_branch(BranchType.CallDestination, branch_target)
-
-        elif instr == 'jr':
-            branch_target = sign_extend(immed, 32) + addr
-            result.add_branch(BranchType.UnconditionalBranch, branch_target)
-
-        elif instr == 'dispose' and dst_reg != None:
-            result.add_branch(BranchType.FunctionReturn)
-
-        elif instr == 'switch':
-            result.add_branch(BranchType.IndirectBranch)
-        elif instr in ['feret', 'eiret', 'ctret', 'reti']:
-            result.add_branch(BranchType.FunctionReturn)
+        add_branches = BranchHandlers.get(instr)
+        if add_branches is not None:
+            add_branches(result, insn, addr)
 
         return result
         # instr, _, _, _, _, _, length, src_value, _ = self.decode_instruction(data, addr)
@@ -648,340 +1359,142 @@ class V850(Architecture):
         # return result
 
     def get_instruction_text(self, data, addr):
-        instr, length, src_reg, dst_reg, reg3, reg4, immed, cond = self.decode_instruction(data, addr)
+        insn = self.decode_instruction(data, addr)
+        instr = insn.instr
         if instr is None:
             return None
 
-        instruction_text = instr
-        tokens = [
-            InstructionTextToken(InstructionTextTokenType.TextToken, '{:8s}'.format(instruction_text))
-        ]
-
-        # if instr in NoRegisterInstructions.values():
-        #     return tokens, length
-        if instr in OneRegInstructions and dst_reg is not None:
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-
-        if instr in TwoRegInstructions and src_reg is not None and dst_reg is not None and immed is None:
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[src_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-
-        if instr in RegImmediateInstructions and src_reg is None and dst_reg is not None and immed is not None:
-            tokens += [InstructionTextToken(InstructionTextTokenType.PossibleAddressToken, hex(immed), immed)]
-            tokens += [InstructionTextToken(InstructionTextTokenType.TextToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-
-        if instr in ImmediateRegRegInstructions and src_reg is not None and dst_reg is not None and immed is not None:
-            tokens += [InstructionTextToken(InstructionTextTokenType.IntegerToken, hex(immed), immed)]
-            tokens += [InstructionTextToken(InstructionTextTokenType.TextToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[src_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-
-        if instr in LoadInstructions:
-            tokens += [InstructionTextToken(InstructionTextTokenType.IntegerToken, hex(immed), immed)]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, '[')]
-            if src_reg is None:
-                tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, 'ep')]
-            else:
-                tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[src_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, '], ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-
-        if instr in StoreInstructions:
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[src_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.IntegerToken, hex(immed), immed)]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, '[')]
-            if dst_reg is None:
-                tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, 'ep')]
-            else:
-                tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ']')]
-
-        if instr in ['mul', 'mulu']:
-            if immed is not None:
-                tokens += [InstructionTextToken(InstructionTextTokenType.PossibleAddressToken, hex(immed), immed)]
-            else:
-                tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[src_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[reg3])]
-
-        if instr == 'jmp':
-            if immed is not None:
-                tokens += [InstructionTextToken(InstructionTextTokenType.PossibleAddressToken, hex(immed), immed)]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, '[')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ']')]
-
-        if instr == 'jr':
-            branch_target = immed + addr
-            tokens += [InstructionTextToken(InstructionTextTokenType.PossibleAddressToken, hex(branch_target), branch_target)]
+        mnem_token = MnemonicTokens.get(instr)
+        if mnem_token is None:
+            mnem_token = MnemonicTokens[instr] = InstructionTextToken(_TxtTok, '{:8s}'.format(instr))
+        tokens = [mnem_token]
 
-        if instr == 'jarl':
-            branch_target = immed + addr
-            tokens += [InstructionTextToken(InstructionTextTokenType.PossibleAddressToken, hex(branch_target), branch_target)]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[dst_reg])]
+        emit = TextEmitters.get(instr)
+        if emit is not None:
+            emit(tokens, insn, addr)
 
-        if instr[0] == 'b' and instr != 'bsw' and instr != 'bsh':
-            # TODO - consider what the best place to fix up immediates is
-            branch_target = immed + addr
-            tokens += [InstructionTextToken(InstructionTextTokenType.PossibleAddressToken, hex(branch_target), branch_target)]
-
-        if instr == 'prepare':
-            registers = sorted(dst_reg.bit._fields_, key = lambda tup: tup[0])
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, '{')]
-            handled_a_register = False
-            for r in registers:
-                regname = r[0]
-                printable_regname = regname
-                if regname == 'r30': printable_regname = 'ep'
-                if regname == 'r31': printable_regname = 'lp'
-                if getattr(dst_reg.bit, regname):
-                    handled_a_register = True
-                    tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, printable_regname)]
-                    tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            if handled_a_register: tokens.pop()
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, '}, ')]
-            tokens += [InstructionTextToken(InstructionTextTokenType.IntegerToken, hex(immed), immed)]
-            if src_reg != None:
-                tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-                if length == 4:
-                    tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[src_reg])]
-                else:
-                    tokens += [InstructionTextToken(InstructionTextTokenType.IntegerToken, hex(src_reg))]
-
-        if instr == 'dispose':
-            tokens += [InstructionTextToken(InstructionTextTokenType.IntegerToken, hex(immed), immed)]
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', {')]
-
-            registers = sorted(dst_reg.bit._fields_, key = lambda tup: tup[0])
-            handled_a_register = False
-            for r in registers:
-                regname = r[0]
-                printable_regname = regname
-                if regname == 'r30': printable_regname = 'ep'
-                if regname == 'r31': printable_regname = 'lp'
-                if getattr(dst_reg.bit, regname):
-                    handled_a_register = True
-                    tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, printable_regname)]
-                    tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-            if handled_a_register: tokens.pop()
-            tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, '}')]
-            if src_reg != None:
-                tokens += [InstructionTextToken(InstructionTextTokenType.OperandSeparatorToken, ', ')]
-                tokens += [InstructionTextToken(InstructionTextTokenType.RegisterToken, Registers[src_reg])]
-
-        return tokens, length
+        return tokens, insn.length
 
     def get_instruction_low_level_il(self, data, addr, il):
-        instr, length, src_reg, dst_reg, reg3, reg4, immed, cond = self.decode_instruction(data, addr)
+        insn = self.decode_instruction(data, addr)
+        instr = insn.instr
         if instr is None:
             return None
-
-        if instr in ['nop', 'synce', 'syncm', 'syncp', 'di', 'ei']:
+        lift = FastLifters.get(instr)
+        if lift is not None:
+            lift(il, insn, addr)
+            return insn.length
+        length, src_reg, dst_reg, reg3, immed = insn.length, insn.src_reg, insn.dst_reg, insn.reg3, insn.immed
+        append = il.append
+
+        if instr in NopInstructions:
             # TODO - something better we can emit for sync instructions?
-            il.append(il.nop())
-        elif instr in ['feret', 'eiret', 'ctret', 'reti']:
+            append(il.nop())
+        elif instr in ReturnInstructions:
             # TODO - use real jump targets (if possible?)
-            il.append(il.ret(il.reg(4, 'lp')))
+            append(il.ret(il.reg(4, 'lp')))
         elif instr == 'jmp':
-            il.append(il.jump(il.reg(4, Registers[dst_reg])))
-            # il.append(il.ret(il.reg(4, Registers[dst_reg])))
-        # elif instr == 'dispose' and src_reg != None:
-        #     il.append(il.ret(to_il_src_reg(il, src_reg)))
+            append(il.jump(il.reg(4, Registers[dst_reg])))
+            # append(il.ret(il.reg(4, Registers[dst_reg])))
+        # elif instr == 'dispose' and src_reg is not None:
+        #     append(il.ret(to_il_src_reg(il, src_reg)))
         elif instr == 'dispose':
-            if immed > 0:
-                il.append(il.set_reg(4, 'sp', il.add(4, il.reg(4, 'sp'), il.const(4, immed))))
-            registers = sorted(dst_reg.bit._fields_, key = lambda tup: tup[0], reverse = True)
-            for r in registers:
-                regname = r[0]
-                printable_regname = regname
-                if regname == 'r30': printable_regname = 'ep'
-                if regname == 'r31': printable_regname = 'lp'
-                if getattr(dst_reg.bit, regname):
-                    il.append(il.set_reg(4, printable_regname, il.pop(4)))
-            if src_reg != None:
-                il.append(il.ret(to_il_src_reg(il, src_reg)))
+            adjust_sp(il, immed)
+            for regname in RegisterListsDescending[dst_reg]:
+                append(il.set_reg(4, regname, il.pop(4)))
+            if src_reg is not None:
+                append(il.ret(to_il_src_reg(il, src_reg)))
         elif instr == 'prepare':
-            registers = sorted(dst_reg.bit._fields_, key = lambda tup: tup[0])
-            for r in registers:
-                regname = r[0]
-                printable_regname = regname
-                if regname == 'r30': printable_regname = 'ep'
-                if regname == 'r31': printable_regname = 'lp'
-                if getattr(dst_reg.bit, regname):
-                    il.append(il.push(4, il.reg(4, printable_regname)))
-            if immed > 0:
-                il.append(il.set_reg(4, 'sp', il.sub(4, il.reg(4, 'sp'), il.const(4, immed))))
-            if src_reg != None:
+            for regname in RegisterLists[dst_reg]:
+                append(il.push(4, il.reg(4, regname)))
+            adjust_sp(il, -immed)
+            if src_reg is not None:
                 if length == 4:
-                    il.append(il.set_reg(4, 'ep', to_il_src_reg(il, src_reg)))
+                    append(il.set_reg(4, 'ep', to_il_src_reg(il, src_reg)))
                 else:
-                    il.append(il.set_reg(4, 'ep', il.const(4, src_reg)))
-        elif instr == 'mov':
-            if src_reg != None:
-                il.append(to_il_set_reg(il, Registers[dst_reg], to_il_src_reg(il, src_reg)))
-            else:
-                il.append(to_il_set_reg(il, Registers[dst_reg], il.const(4, immed)))
-        elif instr == 'movhi' and dst_reg != None:
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.add(4, to_il_src_reg(il, src_reg), il.shift_left(4, il.const(2, immed), il.const(1, 16)))))
-        elif instr in StoreInstructions:
-            if dst_reg == None:
-                dst_reg = Registers.index('ep')
-            il.append(il.store(StorageSize[instr.split('.')[1]],
-                il.add(4, to_il_src_reg(il, dst_reg), il.const(4, immed)),
-                to_il_src_reg(il, src_reg)))
-        elif instr in LoadInstructions:
-            if src_reg == None:
-                src_reg = Registers.index('ep')
-            if instr[-1] == 'u':
-                extend = il.zero_extend
-            else:
-                extend = il.sign_extend
-            il.append(to_il_set_reg(il, Registers[dst_reg],
-                extend(4,
-                    il.load(StorageSize[instr.split('.')[1]],
-                    il.add(4, to_il_src_reg(il, src_reg), il.const(4, immed))))))
-        elif instr == 'movea':
-            il.append(to_il_set_reg(il, Registers[dst_reg],
-                il.add(4, to_il_src_reg(il, src_reg), il.const(4, immed))))
+                    append(il.set_reg(4, 'ep', il.const(4, src_reg)))
+        elif instr == 'movhi' and dst_reg is not None:
+            # The movea must not be a branch target: it would then be lifted
+            # again on its own and the low half added twice.
+            if (FUSE_CONST_LOAD and src_reg == 0 and len(data) >= length + 4
+                    and il.get_label_for_address(_arch(), addr + length) is None):
+                low = self.decode_instruction(data[length:], addr + length)
+                if low.instr == 'movea' and low.src_reg == dst_reg and low.dst_reg == dst_reg:
+                    value = ((immed << 16) + low.immed) & 0xffffffff
+                    append(il.set_reg(4, Registers[dst_reg], il.const(4, value)))
+                    return length + low.length
+            append(to_il_set_reg(il, Registers[dst_reg], il.add(4, to_il_src_reg(il, src_reg), il.shift_left(4, il.const(2, immed), il.const(1, 16)))))
         elif instr == 'jarl':
-            branch_target = sign_extend(immed, 32) + addr
-            # il.append(il.ret(il.const_pointer(4, branch_target)))
-            il.append(il.call(il.const_pointer(4, branch_target)))
+            branch_target = immed + addr
+            # append(il.ret(il.const_pointer(4, branch_target)))
+            append(il.call(il.const_pointer(4, branch_target)))
             # if dst_reg != Registers.index('lp'):
-            #     il.append(il.set_reg(4, Registers[dst_reg], il.const(4, addr + length)))
-            # il.append(il.set_reg(4, Registers[dst_reg], il.const(4, addr + length)))
-            # il.append(il.jump(il.const_pointer(4, branch_target)))
+            #     append(il.set_reg(4, Registers[dst_reg], il.const(4, addr + length)))
+            # append(il.set_reg(4, Registers[dst_reg], il.const(4, addr + length)))
+            # append(il.jump(il.const_pointer(4, branch_target)))
             # TODO -consider this
             # if dst_reg == Registers.index('lp'):
-            #     il.append(il.call(il.const_pointer(4, branch_target)))
+            #     append(il.call(il.const_pointer(4, branch_target)))
             # else:
-            #     il.append(il.set_reg(4, Registers[dst_reg], il.const(4, addr + length)))
-            #     il.append(il.jump(il.const_pointer(4, branch_target)))
+            #     append(il.set_reg(4, Registers[dst_reg], il.const(4, addr + length)))
+            #     append(il.jump(il.const_pointer(4, branch_target)))
         elif instr == 'jr':
-            branch_target = sign_extend(immed, 32) + addr
-            il.append(il.jump(il.const(4, branch_target)))
-        elif instr == 'add':
-            src = to_il_src_reg(il, src_reg) if immed is None else il.const(4, immed)
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.add(4, src, to_il_src_reg(il, dst_reg), flags='*')))
-        elif instr == 'addi':
-            op1 = to_il_src_reg(il, src_reg)
-            op2 = il.const(4, immed)
-            # if dst_reg == 0:
-            #     # TODO - this is a  massive hack to get flags set correctly while still allowing me to be lazy
-            #     il.append(to_il_set_reg(il, Registers[dst_reg], il.sub(4, il.const(5, (-1 * immed) - 1), op1, flags='*')))
-            # else:
-            #     il.append(to_il_set_reg(il, Registers[dst_reg], il.add(4, op2, op1, flags='*')))
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.add(4, op2, op1, flags='*')))
-        elif instr == 'sub':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.sub(4, to_il_src_reg(il, dst_reg), to_il_src_reg(il, src_reg), flags='*')))
+            branch_target = immed + addr
+            append(il.jump(il.const(4, branch_target)))
         elif instr == 'subr':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.sub(4, to_il_src_reg(il, src_reg), to_il_src_reg(il, dst_reg), flags='*')))
-        elif instr in ['mul', 'mulu']:
+            append(to_il_set_reg(il, Registers[dst_reg], il.sub(4, to_il_src_reg(il, src_reg), to_il_src_reg(il, dst_reg), flags='*')))
+        elif instr in MulInstructions:
             operation = il.mult_double_prec_signed if instr == 'mul' else il.mult_double_prec_unsigned
             dst_hi = Registers[reg3]
             dst_lo = Registers[dst_reg]
             op1 = to_il_src_reg(il, src_reg) if immed is None else il.const(4, immed)
             mul_result = operation(8, to_il_src_reg(il, dst_reg), op1)
-            il.append(to_il_set_reg(il, dst_hi, il.logical_shift_right(4, mul_result, il.const(4, 32))))
+            append(to_il_set_reg(il, dst_hi, il.logical_shift_right(4, mul_result, il.const(4, 32))))
             if dst_hi != dst_lo:
                 # we're not discarding the low 32 bits
-                il.append(to_il_set_reg(il, dst_lo, mul_result))
+                append(to_il_set_reg(il, dst_lo, mul_result))
         elif instr == 'mulh':
             src = to_il_src_reg(il, src_reg, 2) if immed is None else il.const(2, immed)
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.mult(4, src, to_il_src_reg(il, dst_reg, 2))))
+            append(to_il_set_reg(il, Registers[dst_reg], il.mult(4, src, to_il_src_reg(il, dst_reg, 2))))
         elif instr == 'mulhi':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.mult(4, il.const(2, immed), to_il_src_reg(il, src_reg, 2))))
-        elif instr == 'cmp':
-            src = to_il_src_reg(il, src_reg) if immed is None else il.const(4, immed)
-            il.append(il.sub(4, to_il_src_reg(il, dst_reg), src, flags='*'))
-        elif instr == 'br':
-            branch_target = sign_extend(immed, 32) + addr
-            il.append(il.jump(il.const(4, branch_target)))
-        elif instr in BranchConditionCode:
-            branch_target = il.const(4, sign_extend(immed, 32) + addr)
-            cond = il.flag_condition(BranchConditionToILCondition[BranchConditionCode.index(instr)])
-            cond_branch(il, cond, branch_target)
-        elif instr in ['and', 'andi']:
+            append(to_il_set_reg(il, Registers[dst_reg], il.mult(4, il.const(2, immed), to_il_src_reg(il, src_reg, 2))))
+        elif instr in AndInstructions:
             src = to_il_src_reg(il, dst_reg) if immed is None else il.const(4, immed)
             and_expr = il.and_expr(4, to_il_src_reg(il, src_reg), src, flags='ovsz')
-            il.append(to_il_set_reg(il, Registers[dst_reg], and_expr))
-            il.append(il.set_flag('ov', il.const(0, 0)))
-        elif instr in ['or', 'ori']:
+            append(to_il_set_reg(il, Registers[dst_reg], and_expr))
+            append(il.set_flag('ov', il.const(0, 0)))
+        elif instr in OrInstructions:
             src = to_il_src_reg(il, dst_reg) if immed is None else il.const(4, immed)
             or_expr = il.or_expr(4, to_il_src_reg(il, src_reg), src, flags='ovsz')
-            il.append(to_il_set_reg(il, Registers[dst_reg], or_expr))
-            il.append(il.set_flag('ov', il.const(0, 0)))
-        elif instr in ['xor', 'xori']:
+            append(to_il_set_reg(il, Registers[dst_reg], or_expr))
+            append(il.set_flag('ov', il.const(0, 0)))
+        elif instr in XorInstructions:
             src = to_il_src_reg(il, dst_reg) if immed is None else il.const(4, immed)
             xor_expr = il.xor_expr(4, to_il_src_reg(il, src_reg), src, flags='ovsz')
-            il.append(to_il_set_reg(il, Registers[dst_reg], xor_expr))
-            il.append(il.set_flag('ov', il.const(0, 0)))
+            append(to_il_set_reg(il, Registers[dst_reg], xor_expr))
+            append(il.set_flag('ov', il.const(0, 0)))
         elif instr == 'not':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.not_expr(4, to_il_src_reg(il, src_reg), flags='ovsz')))
-            il.append(il.set_flag('ov', il.const(0, 0)))
-        elif instr == 'shr':
-            shiftee = to_il_src_reg(il, dst_reg)
-            shift_amount = il.const(4, immed) if immed is not None else to_il_src_reg(il, src_reg)
-            store_in = Registers[dst_reg] if reg3 is None else Registers[reg3]
-
-            shr_expr = il.logical_shift_right(4, shiftee, shift_amount, flags='*')
-            il.append(to_il_set_reg(il, store_in, shr_expr))
-            # TODO - find a better way of doing this? it falls over if shift amount is 0
-            il.append(il.set_flag('cy',
-                il.and_expr(1,
-                    il.const(1, 1),
-                    il.logical_shift_right(4, shiftee, il.sub(4, shift_amount, il.const(1, 1))))))
-            il.append(il.set_flag('ov', il.const(0, 0)))
-        elif instr == 'shl':
-            shiftee = to_il_src_reg(il, dst_reg)
-            shift_amount = il.const(4, immed) if immed is not None else to_il_src_reg(il, src_reg)
-            store_in = Registers[dst_reg] if reg3 is None else Registers[reg3]
-
-            shl_expr = il.shift_left(4, shiftee, shift_amount, flags='*')
-            il.append(to_il_set_reg(il, store_in, shl_expr))
-            # TODO - find a better way of doing this? it falls over if shift amount is 0
-            il.append(il.set_flag('cy',
-                il.and_expr(1,
-                    il.const(4, 0x80000000),
-                    il.shift_left(4, shiftee, il.sub(4, shift_amount, il.const(1, 1))))))
-            il.append(il.set_flag('ov', il.const(0, 0)))
-        elif instr == 'sar':
-            shiftee = to_il_src_reg(il, dst_reg)
-            shift_amount = il.const(4, immed) if immed is not None else to_il_src_reg(il, src_reg)
-            store_in = Registers[dst_reg] if reg3 is None else Registers[reg3]
-
-            sar_expr = il.arith_shift_right(4, shiftee, shift_amount, flags='*')
-            il.append(to_il_set_reg(il, store_in, sar_expr))
-            # TODO - find a better way of doing this? it falls over if shift amount is 0
-            il.append(il.set_flag('cy',
-                il.and_expr(1,
-                    il.const(1, 1),
-                    il.logical_shift_right(4, shiftee, il.sub(4, shift_amount, il.const(1, 1))))))
-            il.append(il.set_flag('ov', il.const(0, 0)))
+            append(to_il_set_reg(il, Registers[dst_reg], il.not_expr(4, to_il_src_reg(il, src_reg), flags='ovsz')))
+            append(il.set_flag('ov', il.const(0, 0)))
+        elif instr in ShiftOperations:
+            shift_il(il, instr, src_reg, dst_reg, reg3, immed)
         elif instr == 'switch':
             pc_plus_two = il.const(4, il.current_address + 2)
             switch_addr = il.add(4, il.shift_left(4, il.reg(4, Registers[dst_reg]), il.const(1, 1)), pc_plus_two)
             new_pc = il.add(4, il.shift_left(4, il.sign_extend(4, il.load(2, switch_addr)), il.const(1, 1)), pc_plus_two)
-            il.append(il.jump(new_pc))
+            append(il.jump(new_pc))
         elif instr == 'zxb':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.zero_extend(4, to_il_src_reg(il, dst_reg, 1))))
+            append(to_il_set_reg(il, Registers[dst_reg], il.zero_extend(4, to_il_src_reg(il, dst_reg, 1))))
         elif instr == 'zxh':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.zero_extend(4, to_il_src_reg(il, dst_reg, 2))))
+            append(to_il_set_reg(il, Registers[dst_reg], il.zero_extend(4, to_il_src_reg(il, dst_reg, 2))))
         elif instr == 'sxb':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.sign_extend(4, to_il_src_reg(il, dst_reg, 1))))
+            append(to_il_set_reg(il, Registers[dst_reg], il.sign_extend(4, to_il_src_reg(il, dst_reg, 1))))
         elif instr == 'sxh':
-            il.append(to_il_set_reg(il, Registers[dst_reg], il.sign_extend(4, to_il_src_reg(il, dst_reg, 2))))
+            append(to_il_set_reg(il, Registers[dst_reg], il.sign_extend(4, to_il_src_reg(il, dst_reg, 2))))
         elif instr == 'cmov':
-            il.append(il.unimplemented())
+            append(il.unimplemented())
         else:
-            il.append(il.unimplemented())
+            append(il.unimplemented())
         return length
 
 class DefaultCallingConvention(CallingConvention):
@@ -0,0 +1,55 @@
+import sys
+import types
+
+# The decoder only needs the plugin module to import. Where the Binary Ninja
+# Python API is not available, stand in a minimal binaryninja module that
+# provides just the names the plugin uses at import time.
+try:
+    import binaryninja  # noqa: F401
+except ImportError:
+    class _Names(object):
+        def __getattr__(self, name):
+            return name
+
+    class _ArchitectureMeta(type):
+        registry = {}
+
+        def __getitem__(cls, name):
+            return _ArchitectureMeta.registry[name]
+
+    class Architecture(metaclass=_ArchitectureMeta):
+        def __init__(self):
+            self.calling_conventions = {}
+            self.standalone_platform = types.SimpleNamespace(default_calling_convention=None)
+
+        @classmethod
+        def register(cls):
+            _ArchitectureMeta.registry[cls.name] = cls()
+
+        def register_calling_convention(self, cc):
+            self.calling_conventions[cc.name] = cc
+
+    class CallingConvention(object):
+        def __init__(self, arch, name):
+            self.arch = arch
+            self.name = name
+
+    class InstructionTextToken(object):
+        def __init__(self, token_type, text, value=0):
+            self.type = token_type
+            self.text = text
+            self.value = value
+
+    stub = types.ModuleType('binaryninja')
+    stub.Architecture = Architecture
+    stub.CallingConvention = CallingConvention
+    stub.InstructionTextToken = InstructionTextToken
+    stub.RegisterInfo = lambda name, size: (name, size)
+    stub.InstructionInfo = object
+    stub.LowLevelILLabel = object
+    stub.LLIL_TEMP = lambda n: n
+    stub.log_error = lambda msg: None
+    for enum_name in ('InstructionTextTokenType', 'BranchType', 'LowLevelILOperation',
+                      'FlagRole', 'LowLevelILFlagCondition'):
+        setattr(stub, enum_name, _Names())
+    sys.modules['binaryninja'] = stub
@@ -0,0 +1,26 @@
+import importlib.util
+import os
+
+import pytest
+
+PLUGIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '__init__.py')
+
+spec = importlib.util.spec_from_file_location('v850', PLUGIN)
+v850 = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(v850)
+
+
+# mov imm32, r1 and jmp imm32[r5]: 6-byte encodings of opcodes 0x31 and 0x37
+# with reg2 == 0.
+@pytest.mark.parametrize('data', [
+    b'\x21\x06\x34\x12\x78\x56',
+    b'\xe5\x06\x34\x12\x78\x56',
+])
+def test_truncated_imm32_decodes_to_error(data):
+    for size in (4, 5):
+        assert v850.decode(data[:size]) == v850.ERROR_TUPLE
+
+
+def test_full_imm32_decodes():
+    assert v850.decode(b'\x21\x06\x34\x12\x78\x56') == ('mov', 6, None, 1, None, None, 0x56781234, None)
+    assert v850.decode(b'\xe5\x06\x34\x12\x78\x56') == ('jmp', 6, None, 5, None, None, 0x56781234, None)